@@ -1,12 +1,14 @@
-import sys, os, json, pygame, pyproj, threading, ctypes, random
+import sys, os, json, time, sqlite3, pygame, pyproj, shapely, threading, ctypes, random
 import geopandas as gpd
 from shapely.geometry import Polygon, MultiPolygon, shape
 from shapely.ops import unary_union, transform
+from history import open_history
+import rasterize
 
 """ Hlavní okno ---------------------------------------------------------------------------------------------------- """
 class MainWindow:
     """Hlavní okno"""
-    def __init__(self, width, height, outermap, country, countrymap, icon):
+    def __init__(self, width, height, outermap, country, countrymap, icon, history):
         pygame.display.set_icon(icon)
         pygame.init()
         set_icon(icon)
@@ -14,6 +16,8 @@ class MainWindow:
         self.mapfile = outermap
         self.country = country
         self.countryfile = countrymap
+        self.history = history # Databáze odehraných kol (None, pokud ji nejde otevřít)
+        self.stats = None # Statistiky země po vyhodnocení
         self.buttons = []
         self.map = Map(self.screen, self.mapfile, self.countryfile, 10, 115, width-20, height-130)
         self.set_buttons()
@@ -27,6 +31,8 @@ class MainWindow:
         while(self.running):
             self.event_handler()
             self.draw_window()
+        if self.history:
+            self.history.flush() # Ať se neztratí poslední kola
         pygame.quit()
 
     def event_handler(self):
@@ -101,10 +107,10 @@ class MainWindow:
                 elif event.key == pygame.K_DELETE:
                     text = "Are you sure you want to delete all drawn structures?"
                     self.alert = Alert(self,text,["Yes","Cancel"], [lambda: self.map.delete_all_drawn_structures(), None])
-                elif event.key == pygame.K_KP_ENTER or event.key == pygame.K_RETURN and self.map.state == "drawing":
+                elif (event.key == pygame.K_KP_ENTER or event.key == pygame.K_RETURN) and self.map.state == "drawing":
                     # Je to delší výpočet, dávám na pozadí
                     self.map.state = "calculating"
-                    thread = threading.Thread(target=self.map.calculate_result)
+                    thread = threading.Thread(target=self.evaluate)
                     thread.start()
 
     def set_title(self):
@@ -113,7 +119,14 @@ class MainWindow:
         elif self.map.state == "calculating":
             self.title = "Calculating..."
         elif self.map.state == "result":
-            self.title = f"Result: {self.map.result:.1f} %"
+            if self.map.scoring_mode == "raster" and self.map.result_error <= rasterize.MAX_ERROR:
+                self.title = f"Result: {self.map.result:.1f} ± {self.map.result_error:.1f} %"
+            elif self.map.scoring_mode == "raster": # Stropy rastru nedovolily dodržet MAX_ERROR
+                self.title = f"Result: ≈ {self.map.result:.1f} %"
+            else:
+                self.title = f"Result: {self.map.result:.1f} %"
+            if self.stats and self.stats["best"] is not None:
+                self.title += f" | Best: {self.stats['best']:.1f} % | Streak: {self.stats['streak']}"
         else:
             self.title = "GeoDraw"
 
@@ -130,6 +143,28 @@ class MainWindow:
         self.country = " ".join(country_name.split("_"))  # Z podtržítek mezery
         self.buttons = []
         self.map = Map(self.screen, self.mapfile, self.countryfile, 10, 115, width - 20, height - 130)
+        self.stats = None # Až po výměně mapy, ať ho nepřepíše dobíhající vyhodnocení staré mapy
+
+    def evaluate(self):
+        """ Vyhodnotí mapu a uloží kolo do historie (běží na pozadí, ne ve vykreslovacím vlákně) """
+        # Během výpočtu může hráč přejít na další zemi, proto si mapu a zemi podržíme
+        game_map = self.map
+        country = self.country
+        game_map.calculate_result()
+        if not self.history:
+            return
+        self.history.add_round(country, game_map.result, game_map.percent_correct_area,
+                               game_map.percent_wrong_area, game_map.time_taken, game_map.vertex_count)
+        # Statistiky už mají zahrnovat i toto kolo, pokud se ho nepodařilo uložit, raději žádné neukážeme
+        if not self.history.flush():
+            return
+        try:
+            stats = self.history.country_stats(country)
+        except sqlite3.Error as error:
+            print(f"GeoDraw: could not read statistics: {error}", file=sys.stderr)
+            return
+        if stats["rounds"] and self.map is game_map:
+            self.stats = stats
 
     def draw_window(self):
         width, height = pygame.display.get_surface().get_size()
@@ -162,6 +197,8 @@ class MainWindow:
 """ Mapa ----------------------------------------------------------------------------------------------------------- """
 class Map:
     """Z GeoJSON udělá vizuální posuvnou a zoomovatelnou mapu v maximálních možných rozměrech."""
+    overlay_thread = None # Vlákno s přesným výpočtem (sdílené všemi mapami, aby jich neběželo víc najednou)
+
     def __init__(self, window, data, country_data, x, y, max_width, max_height):
         self.window = window # Odkaz na okno ve kterém se mapa nachází
         self.surface = None # Plocha kam vygeneruji polygon mapy, abych to mohl generovat, jen když se tam něco změní
@@ -189,6 +226,7 @@ class Map:
         self.country_metric = transform(self.transformer, self.country)
         self.country_area = self.country_metric.area
         self.update_map_surface()
+        self.start_time = time.perf_counter() # Od kdy hráč kreslí
 
     """Vykreslování -----------------------"""
     def draw_map(self):
@@ -352,15 +390,40 @@ class Map:
         """ Vypočítá úspěšnost namalovaného objektu a uloží Polygony překryvů """
         country_multipolygon = self.country_metric
         drawn_multipolygon = self.drawn
+        self.time_taken = time.perf_counter() - self.start_time
+        self.vertex_count = int(shapely.get_num_coordinates(drawn_multipolygon))
         # Je potřeba přepočítat geografické souřadnice, tak aby polygon seděl metricky
         drawn_multipolygon = transform(self.transformer, drawn_multipolygon)
-        # Spočítat průnik a zbytky
-        intersection_metric = country_multipolygon.intersection(drawn_multipolygon)
-        drawn_rest_metric = drawn_multipolygon.difference(country_multipolygon)
-        country_rest_metric = country_multipolygon.difference(drawn_multipolygon)
+        # Složité geometrie (dlouhá pobřeží, opravené čmáranice) by se přesně počítaly příliš dlouho
+        # Přesný výpočet běží na vlastním vlákně, aby se na něj dalo čekat jen TIME_LIMIT. Vlákno ale nejde zastavit,
+        # po vypršení dál počítá na pozadí, proto nový přesný výpočet nespouštíme, dokud ten předchozí neskončí.
+        # Celková doba je tak nejvýše TIME_LIMIT + doba rastru (nejvýše 4 průchody omezené MAX_PIXELS a MAX_BOUNDARY_STEPS).
+        exact = {}
+        busy = Map.overlay_thread is not None and Map.overlay_thread.is_alive()
+        if not busy and rasterize.complexity(country_multipolygon, drawn_multipolygon) <= rasterize.COMPLEXITY_THRESHOLD:
+            Map.overlay_thread = threading.Thread(target=self.calculate_overlay, args=(country_multipolygon, drawn_multipolygon, exact), daemon=True)
+            Map.overlay_thread.start()
+            Map.overlay_thread.join(rasterize.TIME_LIMIT)
+        if "country_rest" in exact:
+            self.scoring_mode = "exact"
+            self.result_error = 0
+            intersection_metric = exact["intersection"]
+            drawn_rest_metric = exact["drawn_rest"]
+            country_rest_metric = exact["country_rest"]
+            intersection_area = intersection_metric.area
+            drawn_rest_area = drawn_rest_metric.area
+        else:
+            self.scoring_mode = "raster"
+            overlay = rasterize.raster_overlay(country_multipolygon, drawn_multipolygon)
+            self.result_error = overlay["error"]
+            intersection_metric = rasterize.mask_to_geometry(overlay["intersection"], *overlay["grid"])
+            drawn_rest_metric = rasterize.mask_to_geometry(overlay["drawn_rest"], *overlay["grid"])
+            country_rest_metric = rasterize.mask_to_geometry(overlay["country_rest"], *overlay["grid"])
+            intersection_area = overlay["intersection_area"]
+            drawn_rest_area = overlay["drawn_rest_area"]
         # Spočítat procentuální výsledky
-        self.percent_correct_area = (intersection_metric.area / self.country_area) * 100
-        self.percent_wrong_area = (drawn_rest_metric.area / self.country_area) * 100
+        self.percent_correct_area = (intersection_area / self.country_area) * 100
+        self.percent_wrong_area = (drawn_rest_area / self.country_area) * 100
         self.result = self.percent_correct_area - self.percent_wrong_area
         # Zpětná transformace
         self.intersection_geom = transform(self.back_transformer, intersection_metric)
@@ -369,6 +432,12 @@ class Map:
         self.state = "result"
         self.update_map_surface()
 
+    def calculate_overlay(self, country_multipolygon, drawn_multipolygon, output):
+        """ Přesně spočítá průnik a zbytky, výsledek zapíše do slovníku 'output' """
+        output["intersection"] = country_multipolygon.intersection(drawn_multipolygon)
+        output["drawn_rest"] = drawn_multipolygon.difference(country_multipolygon)
+        output["country_rest"] = country_multipolygon.difference(drawn_multipolygon)
+
 """ Tlačítko ------------------------------------------------------------------------------------------------------- """
 class Button:
     """Jednoduché tlačítko."""
@@ -569,7 +638,7 @@ class Styles:
         self.fontsizes = styles["fontsizes"]
         self.color = styles["colors"]
 
-def run_pygame(width=1000,height=700, background_map_file=None, country_file=None):
+def run_pygame(width=1000,height=700, background_map_file=None, country_file=None, history=None):
     """ Spustí hru se zadanými parametry (Pak je ještě potřeba zvenku zavolat .mainloop())"""
     global styles
     styles = Styles(resource_path("styles/normal.json"))
@@ -577,11 +646,13 @@ def run_pygame(width=1000,height=700, background_map_file=None, country_file=Non
         background_map_file = resource_path("data/worldmap.geojson")
     if country_file is None:
         country_file = pick_random_country(resource_path("country_data"))
+    if history is None:
+        history = open_history()
     country_name = country_file.split("/")[-1].split(".")[0] # Chci název souboru
     country_name = " ".join(country_name.split("_")) # Z podtržítek mezery
-    return MainWindow(width, height, gpd.read_file(background_map_file), country_name, gpd.read_file(country_file), pygame.image.load(resource_path("styles/icon.png")))
+    return MainWindow(width, height, gpd.read_file(background_map_file), country_name, gpd.read_file(country_file), pygame.image.load(resource_path("styles/icon.png")), history)
 
 if __name__ == "__main__":
     styles = Styles(resource_path("styles/normal.json"))
-    run = MainWindow(1000, 700, gpd.read_file(resource_path("data/worldmap.geojson")), "France", gpd.read_file(resource_path("geoBoundaries-FRA-ADM0_simplified.topojson")), pygame.image.load(resource_path("styles/icon.png")))
+    run = MainWindow(1000, 700, gpd.read_file(resource_path("data/worldmap.geojson")), "France", gpd.read_file(resource_path("geoBoundaries-FRA-ADM0_simplified.topojson")), pygame.image.load(resource_path("styles/icon.png")), open_history())
     run.mainloop()
\ No newline at end of file
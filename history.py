@@ -0,0 +1,182 @@
+import os, sys, time, queue, sqlite3, threading
+from contextlib import closing
+
+""" Historie výsledků ---------------------------------------------------------------------------------------------- """
+BATCH_SIZE = 256 # Maximální počet kol zapsaných v jedné transakci
+BATCH_LINGER = 0.05 # Jak dlouho (s) čekat na další kola, než se dávka zapíše
+FLUSH_TIMEOUT = 5.0 # Nejdelší čekání (s) na zapsání fronty, ať se hra nikdy nezasekne
+STREAK_THRESHOLD = 50 # Minimální výsledek (%), který se počítá do série
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rounds (
+    id INTEGER PRIMARY KEY,
+    played_at REAL NOT NULL,
+    country TEXT NOT NULL,
+    score REAL NOT NULL,
+    correct_area REAL NOT NULL,
+    wrong_area REAL NOT NULL,
+    time_taken REAL NOT NULL,
+    vertex_count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_rounds_played ON rounds(played_at);
+CREATE INDEX IF NOT EXISTS idx_rounds_country_played ON rounds(country, played_at);
+DROP INDEX IF EXISTS idx_rounds_country_score; -- Nejlepší výsledek se bere z country_stats, index jen zpomaloval zápis
+CREATE TABLE IF NOT EXISTS country_stats (
+    country TEXT PRIMARY KEY,
+    rounds INTEGER NOT NULL,
+    score_sum REAL NOT NULL,
+    best_score REAL NOT NULL,
+    last_played REAL NOT NULL,
+    streak INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS overall_stats (
+    id INTEGER PRIMARY KEY CHECK (id = 0), -- Jediný řádek se sérií přes všechny země
+    streak INTEGER NOT NULL
+);
+"""
+
+INSERT_ROUND = """
+INSERT INTO rounds (played_at, country, score, correct_area, wrong_area, time_taken, vertex_count)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Souhrnné tabulky se aktualizují ve stejné transakci, takže průměry, maxima ani série nemusí procházet všechna kola
+UPSERT_COUNTRY = """
+INSERT INTO country_stats (country, rounds, score_sum, best_score, last_played, streak) VALUES (?, 1, ?, ?, ?, ?)
+ON CONFLICT(country) DO UPDATE SET
+    rounds = rounds + 1,
+    score_sum = score_sum + excluded.score_sum,
+    best_score = MAX(best_score, excluded.best_score),
+    last_played = MAX(last_played, excluded.last_played),
+    streak = CASE WHEN excluded.streak THEN streak + 1 ELSE 0 END
+"""
+
+UPDATE_OVERALL_STREAK = "UPDATE overall_stats SET streak = CASE WHEN ? THEN streak + 1 ELSE 0 END WHERE id = 0"
+
+class ResultHistory:
+    """Ukládá výsledky kol do lokální SQLite databáze. Zápisy běží v dávkách na vlastním vlákně."""
+    def __init__(self, path=None):
+        self.path = path if path is not None else history_path()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with closing(self.connect()) as connection:
+            connection.execute("PRAGMA journal_mode=WAL") # Čtení neblokuje zápis
+            connection.executescript(SCHEMA)
+            self.migrate(connection)
+        self.queue = queue.Queue()
+        self.writer = threading.Thread(target=self.write_loop, daemon=True)
+        self.writer.start()
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=5)
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def migrate(self, connection):
+        """Doplní uložené série do databází z doby, kdy se série počítaly až při dotazu (jednorázově)"""
+        with connection:
+            if "streak" not in [column[1] for column in connection.execute("PRAGMA table_info(country_stats)")]:
+                connection.execute("ALTER TABLE country_stats ADD COLUMN streak INTEGER NOT NULL DEFAULT 0")
+                countries = [row[0] for row in connection.execute("SELECT country FROM country_stats")]
+                connection.executemany("UPDATE country_stats SET streak = ? WHERE country = ?",
+                                       [(count_streak(connection, country), country) for country in countries])
+            if connection.execute("SELECT 1 FROM overall_stats").fetchone() is None:
+                connection.execute("INSERT INTO overall_stats (id, streak) VALUES (0, ?)", (count_streak(connection),))
+
+    """Zápis --------------------------"""
+    def add_round(self, country, score, correct_area, wrong_area, time_taken, vertex_count):
+        """Zařadí kolo do fronty k zápisu (neblokuje volající vlákno)"""
+        self.queue.put((time.time(), country, score, correct_area, wrong_area, time_taken, vertex_count))
+
+    def flush(self, timeout=FLUSH_TIMEOUT):
+        """Počká, dokud nejsou všechna kola ve frontě zapsaná (nejvýše 'timeout' sekund). Vrací, zda se to stihlo."""
+        if not self.writer.is_alive(): # Nikdo by frontu nevyprázdnil
+            return False
+        with self.queue.all_tasks_done:
+            return self.queue.all_tasks_done.wait_for(lambda: not self.queue.unfinished_tasks, timeout)
+
+    def close(self):
+        """Zapíše zbytek fronty a ukončí zapisovací vlákno"""
+        self.queue.put(None)
+        self.writer.join()
+
+    def write_loop(self):
+        with closing(self.connect()) as connection:
+            while True:
+                batch = [self.queue.get()]
+                # Posbíráme, co přijde během krátké chvíle, ať je jedna transakce na více kol
+                while batch[-1] is not None and len(batch) < BATCH_SIZE:
+                    try:
+                        batch.append(self.queue.get(timeout=BATCH_LINGER))
+                    except queue.Empty:
+                        break
+                rows = [row for row in batch if row is not None]
+                try:
+                    if rows:
+                        self.write_batch(connection, rows)
+                except sqlite3.Error as error:
+                    # Chyba jedné dávky (zamčená databáze, plný disk, ...) nesmí ukončit zapisovací vlákno
+                    print(f"GeoDraw: {len(rows)} rounds were not saved to history: {error}", file=sys.stderr)
+                finally:
+                    for _ in batch:
+                        self.queue.task_done()
+                if len(rows) < len(batch): # Přišel požadavek na ukončení
+                    return
+
+    def write_batch(self, connection, rows):
+        with connection: # Jedna transakce pro celou dávku
+            connection.executemany(INSERT_ROUND, rows)
+            # Kola jdou v pořadí odehrání, takže série se v rámci dávky posouvá správně
+            streaks = [row[2] is not None and row[2] >= STREAK_THRESHOLD for row in rows]
+            connection.executemany(UPSERT_COUNTRY, [(row[1], row[2], row[2], row[0], streak)
+                                                    for row, streak in zip(rows, streaks)])
+            connection.executemany(UPDATE_OVERALL_STREAK, [(streak,) for streak in streaks])
+
+    """Dotazy --------------------------"""
+    def country_stats(self, country):
+        """Statistiky jedné země: počet kol, průměr, nejlepší výsledek a aktuální série"""
+        with closing(self.connect()) as connection:
+            row = connection.execute("SELECT rounds, score_sum, best_score, streak FROM country_stats WHERE country = ?",
+                                     (country,)).fetchone()
+        if row is None:
+            return {"rounds": 0, "average": None, "best": None, "streak": 0}
+        return {"rounds": row[0], "average": row[1] / row[0], "best": row[2], "streak": row[3]}
+
+    def overall_stats(self):
+        """Souhrnné statistiky přes všechny země"""
+        with closing(self.connect()) as connection:
+            rounds, score_sum, best, countries = connection.execute(
+                "SELECT COALESCE(SUM(rounds), 0), SUM(score_sum), MAX(best_score), COUNT(*) FROM country_stats").fetchone()
+            streak = connection.execute("SELECT streak FROM overall_stats WHERE id = 0").fetchone()[0]
+        average = score_sum / rounds if rounds else None
+        return {"rounds": rounds, "average": average, "best": best, "countries": countries, "streak": streak}
+
+    def best_scores(self, limit=10):
+        """Nejlepší výsledky jednotlivých zemí seřazené sestupně"""
+        with closing(self.connect()) as connection:
+            return connection.execute("SELECT country, best_score FROM country_stats ORDER BY best_score DESC LIMIT ?",
+                                      (limit,)).fetchall()
+
+def count_streak(connection, country=None, threshold=STREAK_THRESHOLD):
+    """ Spočítá sérii procházením kol od nejnovějšího (pomalé, jen pro migraci starých databází) """
+    if country is None:
+        cursor = connection.execute("SELECT score FROM rounds ORDER BY played_at DESC")
+    else:
+        cursor = connection.execute("SELECT score FROM rounds WHERE country = ? ORDER BY played_at DESC", (country,))
+    streak = 0
+    for (score,) in cursor:
+        if score < threshold:
+            break
+        streak += 1
+    return streak
+
+def open_history(path=None):
+    """ Otevře historii, pokud to nejde (nezapisovatelná složka, zamčená databáze), hra poběží bez ní a vrátí None """
+    try:
+        return ResultHistory(path)
+    except (OSError, sqlite3.Error) as error:
+        print(f"GeoDraw: result history is unavailable: {error}", file=sys.stderr)
+        return None
+
+def history_path():
+    """ Cesta k databázi v domovské složce uživatele (u exe nechceme zapisovat do dočasné složky PyInstalleru) """
+    return os.path.join(os.path.expanduser("~"), ".geodraw", "history.sqlite3")
@@ -1,4 +1,6 @@
 from gamemap import * # Zde už importujeme hodně knihoven potřebných i k tomuto scriptu
+import sqlite3
+from history import open_history
 from PyQt6.QtWidgets import *
 from PyQt6.QtCore import *
 from PyQt6.QtGui import *
@@ -7,6 +9,7 @@ from PyQt6.QtGui import *
 class Menu(QWidget):
     def __init__(self):
         super().__init__()
+        self.history = open_history() # Sdílená databáze výsledků pro všechny hry (None, pokud ji nejde otevřít)
         self.init_ui()
         self.show()
 
@@ -23,10 +26,17 @@ class Menu(QWidget):
         btn_random.setObjectName("random_country")
         btn_random.clicked.connect(self.spustit_hru)
 
+        self.stats_label = QLabel()
+        self.stats_label.setObjectName("stats")
+        self.stats_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.update_stats()
+
         middle_v_layout.addWidget(title,1)
         middle_v_layout.addStretch(1)
         middle_v_layout.addWidget(btn_random,1)
-        middle_v_layout.addStretch(5)
+        middle_v_layout.addStretch(1)
+        middle_v_layout.addWidget(self.stats_label,2)
+        middle_v_layout.addStretch(3)
 
         h_layout.addStretch(1)
         h_layout.addLayout(middle_v_layout, 2)
@@ -47,14 +57,38 @@ class Menu(QWidget):
             pass
         self.setWindowIcon(QIcon(resource_path('styles/icon.png')))
 
+    def update_stats(self):
+        """ Vypíše souhrnné statistiky z historie odehraných kol """
+        if not self.history:
+            self.stats_label.setText("Statistics unavailable")
+            return
+        try:
+            stats = self.history.overall_stats()
+            best_scores = self.history.best_scores(3)
+        except sqlite3.Error as error:
+            print(f"GeoDraw: could not read statistics: {error}", file=sys.stderr)
+            self.stats_label.setText("Statistics unavailable")
+            return
+        if not stats["rounds"]:
+            self.stats_label.setText("No rounds played yet")
+            return
+        lines = [f"Rounds played: {stats['rounds']} ({stats['countries']} countries)",
+                 f"Average result: {stats['average']:.1f} %",
+                 f"Best result: {stats['best']:.1f} %",
+                 f"Current streak: {stats['streak']}"]
+        for country, best in best_scores:
+            lines.append(f"{country}: {best:.1f} %")
+        self.stats_label.setText("\n".join(lines))
+
     def spustit_hru(self):
         scale_factor = self.devicePixelRatioF()
         sirka = self.frameGeometry().width()*scale_factor
         vyska = self.frameGeometry().height()*scale_factor
-        gamemap = run_pygame(width=sirka, height=vyska)
+        gamemap = run_pygame(width=sirka, height=vyska, history=self.history)
         self.hide()
         gamemap.mainloop()
 
+        self.update_stats()
         self.show()
 
 
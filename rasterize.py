@@ -0,0 +1,215 @@
+import math
+import numpy as np
+import shapely
+from shapely.geometry.polygon import orient
+
+""" Rastrové vyhodnocení ------------------------------------------------------------------------------------------- """
+MAX_ERROR = 0.5 # Maximální chyba výsledku v procentních bodech (zaručená, pokud nezasáhnou stropy níže)
+# Stropy drží čas a paměť výpočtu, pokud by je cíl MAX_ERROR překročil, pixel se zvětší (a mez chyby s ním)
+MAX_PIXELS = 4_000_000 # Strop počtu pixelů v dlaždicích, kterými prochází hranice (jen ty se počítají po pixelech)
+MAX_GRID_PIXELS = 250_000_000 # Strop velikosti celé (virtuální) mřížky přes obě geometrie
+MAX_BOUNDARY_STEPS = 1_000_000 # Strop délky hranic v pixelech (počet úseků hran roste s obvodem / pixel)
+TILE_SIZE = 64 # Strana dlaždice v pixelech
+START_ROWS = 1024 # Počet řádků první (hrubé) mřížky, ze které se pixel zjemňuje podle skutečné chyby
+# Od jakého odhadu (počet vrcholů × počet částí) se přesný výpočet ani nezkouší. Změřeno na dodaných zemích:
+# nejsložitější je Kanada (2.5e9, přesně asi 1-2 s), takže sem spadnou jen opravdu patologické kresby
+COMPLEXITY_THRESHOLD = 10_000_000_000
+TIME_LIMIT = 3.0 # Kolik sekund smí trvat přesný výpočet, než se použije rastr (rezerva nad Kanadou)
+DISPLAY_ROWS = 256 # Počet řádků mřížky pro zobrazení výsledku na mapě
+
+def complexity(*geometries):
+    """ Odhad náročnosti booleovských operací: celkový počet vrcholů × celkový počet částí """
+    vertices = sum(int(shapely.get_num_coordinates(geom)) for geom in geometries)
+    parts = sum(int(shapely.get_num_geometries(geom)) for geom in geometries)
+    return vertices * parts
+
+def pixel_size(country, drawn, max_steps=MAX_BOUNDARY_STEPS, max_grid_pixels=MAX_GRID_PIXELS):
+    """
+    Vrací (velikost pixelu první hrubé mřížky, nejmenší povolená velikost pixelu kvůli stropům).
+    Pokrytí pixelů se počítá přesně, nejistý je jen průnik v pixelech, kterými prochází obě hranice.
+    Chyba tak roste zhruba lineárně s velikostí pixelu (členité pobřeží ji nezvětšuje, jen prodlužuje výpočet),
+    proto se začíná hrubě a pixel se zmenšuje podle chyby, která skutečně vyšla.
+    """
+    minx, miny, maxx, maxy = shapely.union(country.envelope, drawn.envelope).bounds
+    perimeter = country.length + drawn.length
+    min_size = max(math.sqrt((maxx - minx) * (maxy - miny) / max_grid_pixels), perimeter / max_steps)
+    return max(min_size, max(maxx - minx, maxy - miny) / START_ROWS), min_size
+
+def boundary_pieces(geom, minx, miny, size, width, height):
+    """
+    Rozdělí hrany geometrie na mřížce na úseky, které leží vždy v jednom pixelu.
+    Podle Greenovy věty je plocha geometrie v pixelu = -∮ (min(y, horní okraj) - dolní okraj) dx, takže každý úsek
+    přispěje svému pixelu částí dx × (výška úseku nad dolním okrajem) a všem pixelům pod ním ve sloupci celým dx.
+    Vrací (řádky, sloupce, příspěvek do vlastního pixelu, dx), vše v pixelech, řádek 0 je dole.
+    """
+    # Vnější kruhy proti směru hodinových ručiček, díry po směru, pak se plochy děr samy odečtou
+    polygons = [orient(polygon, 1.0) for polygon in shapely.get_parts(geom)]
+    rings = shapely.get_rings(polygons)
+    coords, ring_index = shapely.get_coordinates(rings, return_index=True)
+    u = (coords[:, 0] - minx) / size
+    v = (coords[:, 1] - miny) / size
+    same_ring = ring_index[1:] == ring_index[:-1]
+    u0, v0, u1, v1 = u[:-1][same_ring], v[:-1][same_ring], u[1:][same_ring], v[1:][same_ring]
+    # Parametry t, ve kterých hrany protínají svislé a vodorovné čáry mřížky, plus začátky a konce hran
+    edges = np.arange(len(u0))
+    edge_x, t_x = grid_crossings(u0, u1)
+    edge_y, t_y = grid_crossings(v0, v1)
+    edge = np.concatenate([edges, edges, edge_x, edge_y])
+    t = np.concatenate([np.zeros(len(edges)), np.ones(len(edges)), t_x, t_y])
+    # Seřadit podle hrany a v ní podle t (t/2 < 1, takže se hrany nepromíchají), rychlejší než lexsort
+    order = np.argsort(edge + t / 2)
+    edge, t = edge[order], t[order]
+    same_edge = edge[1:] == edge[:-1]
+    e, t_start, t_end = edge[:-1][same_edge], t[:-1][same_edge], t[1:][same_edge]
+    ua = u0[e] + t_start * (u1[e] - u0[e])
+    ub = u0[e] + t_end * (u1[e] - u0[e])
+    va = v0[e] + t_start * (v1[e] - v0[e])
+    vb = v0[e] + t_end * (v1[e] - v0[e])
+    cols = np.clip(np.floor((ua + ub) / 2).astype(np.int64), 0, width - 1)
+    rows = np.clip(np.floor((va + vb) / 2).astype(np.int64), 0, height - 1)
+    dx = ub - ua
+    return rows, cols, dx * ((va + vb) / 2 - rows), dx
+
+def grid_crossings(a0, a1):
+    """ Pro hrany z a0 do a1 (v pixelech) vrátí (index hrany, parametr t) všech průsečíků s celými čísly mezi nimi """
+    start = np.floor(np.minimum(a0, a1)) + 1
+    end = np.ceil(np.maximum(a0, a1)) - 1
+    counts = np.maximum(end - start + 1, 0).astype(np.int64)
+    edge = np.repeat(np.arange(len(counts)), counts)
+    offsets = np.cumsum(counts) - counts
+    k = start[edge] + np.arange(len(edge)) - offsets[edge]
+    return edge, (k - a0[edge]) / (a1[edge] - a0[edge])
+
+def coverage(geom, minx, miny, size, width, height):
+    """ Pro každý pixel (height × width) spočítá, jakou jeho část geometrie přesně pokrývá (0 až 1). Řádek 0 je dole. """
+    rows, cols, partial, dx = boundary_pieces(geom, minx, miny, size, width, height)
+    cells = rows * width + cols
+    partial = np.bincount(cells, weights=partial, minlength=width * height).reshape(height, width)
+    carry = np.bincount(cells, weights=dx, minlength=width * height).reshape(height, width)
+    # Každý pixel dostane celé dx od úseků ve vyšších řádcích téhož sloupce
+    below = np.cumsum(carry[::-1], axis=0)[::-1] - carry
+    return np.clip(-(partial + below), 0, 1)
+
+def intersect_covers(country_cover, drawn_cover):
+    """
+    Odhad pokrytí průnikem z pokrytí zemí a kresbou. Tam, kde je jedno z nich 0 nebo 1, je průnik přesně součin,
+    jinde leží v intervalu [low, high] a bereme jeho střed. Vrací (průnik, šířka intervalu).
+    """
+    low = np.maximum(country_cover + drawn_cover - 1, 0)
+    high = np.minimum(country_cover, drawn_cover)
+    exact = (country_cover % 1 == 0) | (drawn_cover % 1 == 0)
+    return np.where(exact, country_cover * drawn_cover, (low + high) / 2), high - low
+
+def tiled_overlay(country, drawn, size, max_pixels=MAX_PIXELS):
+    """
+    Sečte pokrytí průnikem, zemí a kresbou na mřížce rozdělené do dlaždic. Po pixelech se počítají jen dlaždice,
+    kterými prochází některá hranice, ve zbytku je pokrytí v každém sloupci konstantní (dá ho součet dx shora).
+    Vrací slovník s plochami a mezí chyby, nebo None, pokud by hustých pixelů bylo víc než 'max_pixels'.
+    """
+    tile = TILE_SIZE
+    minx, miny, maxx, maxy = shapely.union(country.envelope, drawn.envelope).bounds
+    tiles_x = max(1, math.ceil((maxx - minx) / size / tile))
+    tiles_y = max(1, math.ceil((maxy - miny) / size / tile))
+    width, height = tiles_x * tile, tiles_y * tile
+    pieces = [boundary_pieces(geom, minx, miny, size, width, height) for geom in (country, drawn)]
+    tile_ids = [(rows // tile) * tiles_x + cols // tile for rows, cols, _, _ in pieces]
+    dense = np.unique(np.concatenate(tile_ids))
+    if len(dense) * tile * tile > max_pixels:
+        return None
+    slot = np.full(tiles_x * tiles_y, -1)
+    slot[dense] = np.arange(len(dense))
+    empty = (slot == -1).reshape(tiles_y, tiles_x).repeat(tile, axis=1)
+    dense_covers, empty_covers = [], []
+    for (rows, cols, partial, dx), ids in zip(pieces, tile_ids):
+        # Součet dx z dlaždic ve vyšších řádcích, pro každý sloupec mřížky
+        per_tile_row = np.bincount((rows // tile) * width + cols, weights=dx, minlength=tiles_y * width).reshape(tiles_y, width)
+        above = np.cumsum(per_tile_row[::-1], axis=0)[::-1] - per_tile_row
+        empty_covers.append(np.clip(-above, 0, 1) * empty)
+        # Husté dlaždice naskládané za sebe (dlaždice × řádek × sloupec)
+        local = slot[ids] * tile * tile + (rows % tile) * tile + cols % tile
+        shape = (len(dense), tile, tile)
+        partial = np.bincount(local, weights=partial, minlength=len(dense) * tile * tile).reshape(shape)
+        carry = np.bincount(local, weights=dx, minlength=len(dense) * tile * tile).reshape(shape)
+        below = np.cumsum(carry[:, ::-1], axis=1)[:, ::-1] - carry
+        base = above.reshape(tiles_y, tiles_x, tile)[dense // tiles_x, dense % tiles_x]
+        dense_covers.append(np.clip(-(partial + below + base[:, None, :]), 0, 1))
+    intersection, uncertainty = intersect_covers(*dense_covers)
+    pixel_area = size * size
+    # Prázdné dlaždice mají v každém sloupci všech 'tile' pixelů stejných
+    empty_intersection = (empty_covers[0] * empty_covers[1]).sum() * tile
+    return {"intersection_area": (intersection.sum() + empty_intersection) * pixel_area,
+            "country_area": (dense_covers[0].sum() + empty_covers[0].sum() * tile) * pixel_area,
+            "drawn_area": (dense_covers[1].sum() + empty_covers[1].sum() * tile) * pixel_area,
+            # Výsledek = průnik - přebytek = 2 × průnik - kresba, proto je jeho chyba nejvýše celá šířka intervalu
+            "error": uncertainty.sum() * pixel_area / country.area * 100}
+
+def raster_overlay(country, drawn, max_error=MAX_ERROR, max_pixels=MAX_PIXELS, max_steps=MAX_BOUNDARY_STEPS):
+    """
+    Spočítá plochy průniku a rozdílů dvou geometrií v metrických souřadnicích z přesného pokrytí pixelů.
+    Vrací slovník s plochami, zaručenou mezí chyby výsledku (v procentních bodech) a maskami pro zobrazení.
+    Mez je nejvýše 'max_error', pokud to dovolí stropy (jinak je větší, ale stále zaručená).
+    """
+    size, min_size = pixel_size(country, drawn, max_steps)
+    overlay = tiled_overlay(country, drawn, size, max_pixels)
+    while overlay is None: # Hranice by zabraly příliš mnoho dlaždic, zvětšíme pixel
+        size *= 2
+        overlay = tiled_overlay(country, drawn, size, max_pixels)
+    # Pokud cíl nevyšel, zjemníme úměrně skutečné chybě (ta roste s pixelem zhruba lineárně)
+    for _ in range(3):
+        if overlay["error"] <= max_error or size <= min_size:
+            break
+        size = max(min_size, size * max_error / overlay["error"] * 0.9)
+        finer = tiled_overlay(country, drawn, size, max_pixels)
+        if finer is None: # Jemnější mřížka se nevejde do stropu
+            break
+        overlay = finer
+    # Pro zobrazení stačí hrubá mřížka
+    minx, miny, maxx, maxy = shapely.union(country.envelope, drawn.envelope).bounds
+    display_size = max(maxx - minx, maxy - miny) / DISPLAY_ROWS
+    width = max(1, math.ceil((maxx - minx) / display_size))
+    height = max(1, math.ceil((maxy - miny) / display_size))
+    country_cover = coverage(country, minx, miny, display_size, width, height)
+    drawn_cover = coverage(drawn, minx, miny, display_size, width, height)
+    intersection, _ = intersect_covers(country_cover, drawn_cover)
+    return {"intersection_area": overlay["intersection_area"],
+            "drawn_rest_area": overlay["drawn_area"] - overlay["intersection_area"],
+            "country_rest_area": overlay["country_area"] - overlay["intersection_area"],
+            "error": overlay["error"],
+            "grid": (minx, miny, display_size),
+            "intersection": intersection >= 0.5,
+            "drawn_rest": drawn_cover - intersection >= 0.5,
+            "country_rest": country_cover - intersection >= 0.5}
+
+def mask_to_geometry(mask, minx, miny, size, max_rows=DISPLAY_ROWS):
+    """ Převede masku na MultiPolygon obdélníků (souvislé úseky řádků), jen pro vykreslení, proto zhrubne na max_rows """
+    step = max(1, math.ceil(mask.shape[0] / max_rows))
+    mask = mask[::step, ::step]
+    size = size * step
+    padded = np.pad(mask, ((0, 0), (1, 1))).astype(np.int8)
+    change = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(change == 1)
+    _, ends = np.nonzero(change == -1)
+    boxes = shapely.box(minx + starts * size, miny + rows * size, minx + ends * size, miny + (rows + 1) * size)
+    return shapely.multipolygons(boxes)
+
+if __name__ == "__main__":
+    # Kontrola, že dodané země s typickými kresbami dodrží MAX_ERROR: python rasterize.py
+    import glob, time, pyproj
+    import geopandas as gpd
+    from shapely.ops import unary_union, transform
+    from shapely.affinity import scale
+    to_metric = pyproj.Transformer.from_crs(pyproj.CRS('EPSG:4326'), pyproj.CRS('EPSG:8857'), always_xy=True).transform
+    failed, slowest = [], 0
+    for path in sorted(glob.glob("country_data/*/*/ADM0/*.topojson")):
+        country = transform(to_metric, unary_union([geom.buffer(0) for geom in gpd.read_file(path).geometry]))
+        drawings = {"outline": scale(country.simplify(math.sqrt(country.area) / 50), 1.03, 1.03).buffer(0),
+                    "hull": scale(country.convex_hull, 0.9, 0.9)}
+        for name, drawn in drawings.items():
+            start = time.perf_counter()
+            overlay = raster_overlay(country, drawn)
+            duration = time.perf_counter() - start
+            slowest = max(slowest, duration)
+            if overlay["error"] > MAX_ERROR:
+                failed.append(path)
+                print(f"{path} ({name}): ±{overlay['error']:.3f} > {MAX_ERROR} ({duration:.2f} s)")
+    print(f"{len(failed)} drawings over MAX_ERROR, slowest raster took {slowest:.2f} s")